@@ -1,13 +1,16 @@
 import yaml
 import logging
 
+from users import UserRegistry
+
 config = None
+users = None
 
 logger = logging.getLogger("eqqr.config")
 
 
 def get_config(config_file: str):
-    global config
+    global config, users
     try:
         logger.info(f"Reading config file: {config_file}")
         with open(config_file, "r", encoding="utf-8") as f:
@@ -15,6 +18,13 @@ def get_config(config_file: str):
     except Exception as e:
         logger.error(f"Failed to read config file: {e}")
         exit()
+
+    try:
+        users = UserRegistry.from_config(config.get("users"))
+    except ValueError as e:
+        logger.error(f"Invalid user config: {e}")
+        exit()
+    logger.info(f"Loaded {len(users)} users")
     return config
 
 
@@ -0,0 +1,348 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import config
+
+logger = logging.getLogger("eqqr.coord")
+
+
+# Replicas ingest every source in parallel and race to claim each
+# (event, recipient) pair; only the winner sends. Recipients are sharded
+# by hash so the owning replica claims immediately while the others wait
+# takeover_delay before trying, which balances load and still covers a
+# dead owner. Replicas also heartbeat into the backend: shards with no live
+# owner are claimed immediately, and two processes sharing a replica_id
+# are reported instead of silently leaving a shard to the takeover path.
+class Coordinator:
+    def __init__(
+        self,
+        replica_id: int = 0,
+        replicas: int = 1,
+        takeover_delay: float = 2.0,
+        ttl: int = 86400,
+        heartbeat: float = 5.0,
+    ):
+        if replicas < 1 or not 0 <= replica_id < replicas:
+            raise ValueError(f"invalid replica {replica_id} of {replicas}")
+        self.replica_id = replica_id
+        self.replicas = replicas
+        self.takeover_delay = takeover_delay
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.instance = uuid.uuid4().hex
+        self.live: Optional[Set[int]] = None
+        self.conflicts = 0
+        self.tasks: Set[asyncio.Task] = set()
+
+    def event_key(self, report: Dict[str, Any]) -> str:
+        fields = ("source", "type", "time", "location", "magnitude", "latitude", "longitude")
+        raw = "|".join(str(report.get(f, "")) for f in fields)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def owns(self, recipient: str) -> bool:
+        if self.replicas == 1:
+            return True
+        shard = zlib.crc32(recipient.encode("utf-8")) % self.replicas
+        if shard == self.replica_id:
+            return True
+        return self.live is not None and shard not in self.live
+
+    async def beat_backend(self, now: float) -> Tuple[Optional[str], Dict[int, str]]:
+        # Returns the instance that held our replica_id before this beat,
+        # and the live instance of every replica_id.
+        return None, {self.replica_id: self.instance}
+
+    async def serve_heartbeat(self):
+        while True:
+            try:
+                previous, live = await self.beat_backend(time.time())
+            except Exception as e:
+                logger.error(f"Failed to send replica heartbeat: {e}")
+                await asyncio.sleep(self.heartbeat)
+                continue
+
+            # A restarted replica sees its old instance once; a real
+            # duplicate keeps overwriting us on every beat.
+            if previous is not None and previous != self.instance:
+                self.conflicts += 1
+                if self.conflicts == 2:
+                    logger.error(
+                        f"Another replica is also running as replica_id "
+                        f"{self.replica_id}; give each replica a distinct "
+                        f"EQQR_REPLICA_ID"
+                    )
+            else:
+                self.conflicts = 0
+
+            alive = set(i for i in live if 0 <= i < self.replicas)
+            if alive != self.live:
+                missing = sorted(set(range(self.replicas)) - alive)
+                if missing:
+                    logger.warning(
+                        f"Replicas alive: {sorted(alive)}; claiming shards "
+                        f"{missing} immediately"
+                    )
+                else:
+                    logger.info(f"All {self.replicas} replicas alive")
+                self.live = alive
+            await asyncio.sleep(self.heartbeat)
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def claim(self, event_key: str, recipients: Iterable[str]) -> Set[str]:
+        recipients = list(recipients)
+        try:
+            return await self.claim_backend(event_key, recipients)
+        except Exception as e:
+            # Failing open risks a duplicate alert; failing closed risks none
+            # being sent at all.
+            logger.error(f"Failed to claim {event_key}, sending anyway: {e}")
+            return set(recipients)
+
+    async def claim_backend(self, event_key: str, recipients: List[str]) -> Set[str]:
+        return set(recipients)
+
+
+class SQLiteCoordinator(Coordinator):
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.lock = threading.Lock()
+        self.last_cleanup = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(
+            path, timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS claims ("
+            "event TEXT NOT NULL, recipient TEXT NOT NULL, "
+            "replica INTEGER NOT NULL, claimed_at REAL NOT NULL, "
+            "PRIMARY KEY (event, recipient))"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS claims_claimed_at ON claims (claimed_at)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS replicas ("
+            "replica INTEGER PRIMARY KEY, instance TEXT NOT NULL, "
+            "seen_at REAL NOT NULL)"
+        )
+        logger.info(f"Using SQLite claims at {path}")
+
+    def claim_sync(self, event_key: str, recipients: List[str]) -> Set[str]:
+        claimed = set()
+        now = time.time()
+        with self.lock:
+            cur = self.db.cursor()
+            # IMMEDIATE takes the database write lock up front, so the
+            # whole batch is atomic against other replicas.
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                if now - self.last_cleanup > 60:
+                    cur.execute("DELETE FROM claims WHERE claimed_at < ?", (now - self.ttl,))
+                    self.last_cleanup = now
+                for recipient in recipients:
+                    cur.execute(
+                        "INSERT OR IGNORE INTO claims VALUES (?, ?, ?, ?)",
+                        (event_key, recipient, self.replica_id, now),
+                    )
+                    if cur.rowcount == 1:
+                        claimed.add(recipient)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return claimed
+
+    async def claim_backend(self, event_key: str, recipients: List[str]) -> Set[str]:
+        return await asyncio.to_thread(self.claim_sync, event_key, recipients)
+
+    def beat_sync(self, now: float) -> Tuple[Optional[str], Dict[int, str]]:
+        stale = now - 3 * self.heartbeat
+        with self.lock:
+            cur = self.db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(
+                    "SELECT instance FROM replicas WHERE replica = ? AND seen_at >= ?",
+                    (self.replica_id, stale),
+                )
+                row = cur.fetchone()
+                cur.execute(
+                    "INSERT OR REPLACE INTO replicas VALUES (?, ?, ?)",
+                    (self.replica_id, self.instance, now),
+                )
+                cur.execute(
+                    "SELECT replica, instance FROM replicas WHERE seen_at >= ?", (stale,)
+                )
+                live = dict(cur.fetchall())
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return (row[0] if row else None), live
+
+    async def beat_backend(self, now: float) -> Tuple[Optional[str], Dict[int, str]]:
+        return await asyncio.to_thread(self.beat_sync, now)
+
+
+class RedisCoordinator(Coordinator):
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.lock = asyncio.Lock()
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        logger.info(f"Using Redis claims at {host}:{port}/{db}")
+
+    @staticmethod
+    def encode(*args: Any) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RuntimeError(f"redis error: {body.decode()}")
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode()
+        raise RuntimeError(f"unexpected redis reply: {line!r}")
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=5
+        )
+        if self.password:
+            self.writer.write(self.encode("AUTH", self.password))
+            await self.read_reply()
+        if self.db:
+            self.writer.write(self.encode("SELECT", self.db))
+            await self.read_reply()
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        async with self.lock:
+            try:
+                if self.writer is None:
+                    await self.connect()
+                self.writer.write(b"".join(self.encode(*c) for c in commands))
+                await self.writer.drain()
+                replies = []
+                for _ in commands:
+                    replies.append(await asyncio.wait_for(self.read_reply(), timeout=5))
+                return replies
+            except Exception:
+                await self.close()
+                raise
+
+    async def claim_backend(self, event_key: str, recipients: List[str]) -> Set[str]:
+        if not recipients:
+            return set()
+        # SET NX is atomic per key; pipeline the whole batch.
+        replies = await self.pipeline(
+            [
+                ("SET", f"eqqr:claim:{event_key}:{r}", self.replica_id, "NX", "EX", self.ttl)
+                for r in recipients
+            ]
+        )
+        return set(r for r, reply in zip(recipients, replies) if reply == "OK")
+
+    async def beat_backend(self, now: float) -> Tuple[Optional[str], Dict[int, str]]:
+        expire = max(1, int(3 * self.heartbeat))
+        commands = [
+            ("GET", f"eqqr:replica:{self.replica_id}"),
+            ("SET", f"eqqr:replica:{self.replica_id}", self.instance, "EX", expire),
+        ]
+        commands += [("GET", f"eqqr:replica:{i}") for i in range(self.replicas)]
+        replies = await self.pipeline(commands)
+        live = {i: inst for i, inst in enumerate(replies[2:]) if inst is not None}
+        return replies[0], live
+
+
+coordinator = None
+
+
+def init_coord():
+    global coordinator
+    config_coord = config.config.get("coord")
+    if config_coord is None:
+        return None
+
+    backend = config_coord.get("backend", "sqlite")
+    try:
+        options = {
+            "replica_id": int(
+                os.environ.get("EQQR_REPLICA_ID", config_coord.get("replica_id", 0))
+            ),
+            "replicas": int(config_coord.get("replicas", 1)),
+            "takeover_delay": float(config_coord.get("takeover_delay", 2.0)),
+            "ttl": int(config_coord.get("ttl", 86400)),
+            "heartbeat": float(config_coord.get("heartbeat", 5.0)),
+        }
+        if backend == "sqlite":
+            coordinator = SQLiteCoordinator(
+                path=config_coord.get("path", "data/eqqr.db"), **options
+            )
+        elif backend == "redis":
+            coordinator = RedisCoordinator(
+                host=config_coord.get("host", "127.0.0.1"),
+                port=config_coord.get("port", 6379),
+                db=config_coord.get("db", 0),
+                password=config_coord.get("password"),
+                **options,
+            )
+        else:
+            raise ValueError(f"unknown backend {backend}")
+    except (TypeError, ValueError, sqlite3.Error) as e:
+        logger.error(f"Failed to init coordination: {e}")
+        exit()
+    logger.info(f"Replica {options['replica_id']} of {options['replicas']}")
+
+
+async def serve_coord():
+    if coordinator is None:
+        return
+    await coordinator.serve_heartbeat()
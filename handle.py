@@ -5,7 +5,7 @@ import math
 import time
 import datetime
 import traceback
-from typing import Any, Callable, Coroutine, Dict, Tuple
+from typing import Any, Callable, Coroutine, Dict, List, Mapping, Optional, Tuple
 from geopy.distance import geodesic
 
 from source import (
@@ -17,12 +17,14 @@ from source import (
 )
 import notify
 import config
+import history
+import coord
+import monitor
+from users import User
 
 
 def get_distance(loc1: Tuple[float, float], loc2: Tuple[float, float]) -> float:
-    new_loc1 = (float(loc1[0]), float(loc1[1]))
-    new_loc2 = (float(loc2[0]), float(loc2[1]))
-    return geodesic(new_loc1, new_loc2).km
+    return geodesic(loc1, loc2).km
 
 
 def get_arrivetime(distance: float, report_time: str) -> datetime:
@@ -52,6 +54,9 @@ async def serve():
         serve_source(source_chinaeew, 1),
         serve_source(source_dizhensubao, 1),
         serve_source(source_cene, 5),
+        history.serve_api(),
+        coord.serve_coord(),
+        monitor.serve_monitor(),
     )
 
 
@@ -70,25 +75,34 @@ async def serve_source(source_func: Callable[[], Coroutine[Any, Any, dict[str, A
         if report is None:
             await asyncio.sleep(period)
             continue
+        token = None
+        if monitor.profiler is not None:
+            token = monitor.profiler.begin_event()
         try:
             await handle_report(report)
         except Exception as e:
             traceback.print_exc()
             logger.error(f"Failed to handle report {report}: {e}")
+        if token is not None:
+            monitor.profiler.mark_event(token, report)
 
         await asyncio.sleep(period)
 
 
 async def handle_report(report):
     logger = logging.getLogger("eqqr.handle.report")
-    for user_name in config.config["users"]:
-        user_info = config.config["users"][user_name]
-        location = user_info["location"]
-        loc1 = (location["latitude"], location["longitude"])
-        loc2 = (report["latitude"], report["longitude"])
-
-        magnitude = float(report["magnitude"])
-        dist = get_distance(loc1, loc2)
+    if history.event_history is not None:
+        try:
+            history.event_history.add(report)
+        except Exception as e:
+            logger.error(f"Failed to store report {report}: {e}")
+
+    loc2 = (float(report["latitude"]), float(report["longitude"]))
+    magnitude = float(report["magnitude"])
+    notified = []
+    for user, lat, lon in config.users.locations():
+        user_name = user.name
+        dist = get_distance((lat, lon), loc2)
         lintensity = get_lintensity(dist, report["magnitude"])
         arrivetime = get_arrivetime(dist, report["time"])
 
@@ -104,15 +118,49 @@ async def handle_report(report):
             or (config.config["test"])
         ):
             logger.info(f"Notify {user_name} with {full_report}")
-            await handle_notify(user_info, full_report)
+            notified.append((user, full_report))
         else:
             logger.debug(
                 f"Skip notify {user_name} with {full_report} for long distance"
             )
+    if len(notified) == 0:
+        return
+
+    # Webhook messages for every notified user go out as one batch, started
+    # before the per-user channels so batching adds no alert latency.
+    contacts = await asyncio.gather(
+        *(claim_contact(user, full_report) for user, full_report in notified)
+    )
+    webhook_batch = []
+    for i, (user, full_report) in enumerate(notified):
+        contact = contacts[i]
+        webhook_list = contact.get("webhook", ())
+        if len(webhook_list) == 0 or notify.webhook_notifier is None:
+            continue
+        try:
+            subject, msg = await format_message(user, full_report)
+        except Exception as e:
+            logger.error(f"Failed to format message: {e}")
+            continue
+        webhook_batch.extend(
+            notify.webhook_notifier.messages(msg, webhook_list, subject, full_report)
+        )
+        contacts[i] = {k: v for k, v in contact.items() if k != "webhook"}
+
+    webhook_task = None
+    if len(webhook_batch) > 0:
+        logger.info(f"Notify {len(webhook_batch)} webhook recipients")
+        webhook_task = asyncio.create_task(notify.webhook_notifier.send(webhook_batch))
+
+    for (user, full_report), contact in zip(notified, contacts):
+        await handle_notify(user, full_report, contact=contact)
+
+    if webhook_task is not None:
+        await webhook_task
 
 
 async def format_message(
-    user_info: Dict[str, Any], full_report: Dict[str, Any]
+    user: User, full_report: Dict[str, Any]
 ) -> Tuple[str, str]:
     latitude_str = "北纬" if float(full_report["latitude"]) > 0 else "南纬"
     latitude_str = latitude_str + "{:.2f}".format(abs(float(full_report["latitude"])))
@@ -127,7 +175,7 @@ async def format_message(
 
 
 async def format_alisms_message(
-    user_info: Dict[str, Any], full_report: Dict[str, Any]
+    user: User, full_report: Dict[str, Any]
 ) -> Tuple[str, str]:
     time_msg = full_report["time"]
     try:
@@ -140,22 +188,69 @@ async def format_alisms_message(
     return subject, msg
 
 
-async def handle_notify(user_info: Dict[str, Any], full_report: Dict[str, Any]):
+async def claim_contact(
+    user: User, full_report: Dict[str, Any], takeover: bool = False
+) -> Mapping[str, Tuple[str, ...]]:
+    coordinator = coord.coordinator
+    if coordinator is None:
+        return user.contact
+
+    wanted = []
+    deferred = False
+    for channel, targets in user.contact.items():
+        for target in targets:
+            recipient = f"{user.name}:{channel}:{target}"
+            if takeover or coordinator.owns(recipient):
+                wanted.append(recipient)
+            else:
+                deferred = True
+
+    if deferred and not takeover:
+        coordinator.spawn(takeover_notify(user, full_report))
+    if len(wanted) == 0:
+        return {}
+
+    claimed = await coordinator.claim(coordinator.event_key(full_report), wanted)
+    contact = {}
+    for channel, targets in user.contact.items():
+        kept = tuple(t for t in targets if f"{user.name}:{channel}:{t}" in claimed)
+        if len(kept) > 0:
+            contact[channel] = kept
+    return contact
+
+
+async def takeover_notify(user: User, full_report: Dict[str, Any]):
+    await asyncio.sleep(coord.coordinator.takeover_delay)
+    await handle_notify(user, full_report, takeover=True)
+
+
+async def handle_notify(
+    user: User,
+    full_report: Dict[str, Any],
+    takeover: bool = False,
+    contact: Optional[Mapping[str, Tuple[str, ...]]] = None,
+):
     logger = logging.getLogger("eqqr.handle.notify")
     try:
-        subject, msg = await format_message(user_info, full_report)
+        subject, msg = await format_message(user, full_report)
     except Exception as e:
         logger.error(f"Failed to format message: {e}")
         return
 
-    config_user_message = user_info.get("contact", None)
-    if config_user_message is None:
+    if len(user.contact) == 0:
         logger.warning(f"User {full_report['user']} has no message configured")
         return
 
+    if contact is None:
+        contact = await claim_contact(user, full_report, takeover)
+    config_user_message = contact
+    if len(config_user_message) == 0:
+        logger.debug(f"User {full_report['user']} has nothing left to notify here")
+        return
+
     notify_list = []
 
-    push_list = config_user_message.get("pushdeer", [])
+    push_list = config_user_message.get("pushdeer", ())
     if len(push_list) > 0:
         if notify.pushdeer_notifier is None:
             logger.error("Push notifier is not initialized")
@@ -163,17 +258,17 @@ async def handle_notify(user_info: Dict[str, Any], full_report: Dict[str, Any]):
         for push_key in push_list:
             notify_list.append(notify.pushdeer_notifier.emit(push_msg, push_key))
 
-    alisms_list = config_user_message.get("phone", [])
+    alisms_list = config_user_message.get("phone", ())
     if len(alisms_list) > 0:
         if notify.alisms_notifier is None:
             logger.error("Alisms notifier is not initialized")
 
-        alisms_subject, alisms_msg = await format_alisms_message(user_info, full_report)
+        alisms_subject, alisms_msg = await format_alisms_message(user, full_report)
         notify_list.append(
             notify.alisms_notifier.emit(alisms_list, "SMS_474255084", {"event": alisms_subject, "msg": alisms_msg})
         )
 
-    tg_list = config_user_message.get("tg", [])
+    tg_list = config_user_message.get("tg", ())
     if len(tg_list) > 0:
         if notify.tg_notifier is None:
             logger.error("Telegram notifier is not initialized")
@@ -181,13 +276,22 @@ async def handle_notify(user_info: Dict[str, Any], full_report: Dict[str, Any]):
         for chatid in tg_list:
             notify_list.append(notify.tg_notifier.emit(msg, chatid))
 
-    mail_list = config_user_message.get("mail", [])
+    mail_list = config_user_message.get("mail", ())
     if len(mail_list) > 0:
         if notify.mail_notifier is None:
             logger.error("Mail notifier is not initialized")
 
         notify_list.append(notify.mail_notifier.emit(msg, mail_list, subject))
 
+    webhook_list = config_user_message.get("webhook", ())
+    if len(webhook_list) > 0:
+        if notify.webhook_notifier is None:
+            logger.error("Webhook notifier is not initialized")
+        else:
+            notify_list.append(
+                notify.webhook_notifier.emit(msg, webhook_list, subject, full_report)
+            )
+
     try:
         await asyncio.gather(*notify_list)
     except Exception as e:
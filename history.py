@@ -0,0 +1,290 @@
+import bisect
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+import config
+import monitor
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+logger = logging.getLogger("eqqr.history")
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    return time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+
+
+# Fixed-size ring of reports, indexed by origin time (sorted (ts, seq) list)
+# and by lat/lon grid cell so queries only touch events in the window.
+class EventHistory:
+    def __init__(self, size: int = 10000, cell: float = 1.0):
+        if size <= 0:
+            raise ValueError("history size must be positive")
+        if cell <= 0 or cell > 180:
+            raise ValueError("history cell must be in (0, 180] degrees")
+        self.size = size
+        self.cell = cell
+        self.cells_x = math.ceil(360 / cell)
+        self.cells_y = math.ceil(180 / cell)
+        self.slots: List[Optional[Dict[str, Any]]] = [None] * size
+        self.seq = 0
+        self.time_index: List[Tuple[float, int]] = []
+        self.cell_index: Dict[Tuple[int, int], Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.time_index)
+
+    def cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        cx = math.floor((lon + 180) / self.cell) % self.cells_x
+        cy = min(math.floor((lat + 90) / self.cell), self.cells_y - 1)
+        return cx, cy
+
+    def add(self, report: Dict[str, Any]) -> int:
+        lat = float(report["latitude"])
+        lon = float(report["longitude"])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"coordinates out of range: {lat}, {lon}")
+        ts = parse_time(report["time"])
+
+        seq = self.seq
+        self.seq += 1
+        slot = seq % self.size
+        if self.slots[slot] is not None:
+            self.evict(self.slots[slot])
+
+        entry = {
+            "seq": seq,
+            "timestamp": ts,
+            "received": time.time(),
+            "lat": lat,
+            "lon": lon,
+            "cell": self.cell_of(lat, lon),
+            "report": dict(report),
+        }
+        self.slots[slot] = entry
+        bisect.insort(self.time_index, (ts, seq))
+        self.cell_index.setdefault(entry["cell"], set()).add(seq)
+        return seq
+
+    def evict(self, entry: Dict[str, Any]):
+        key = (entry["timestamp"], entry["seq"])
+        idx = bisect.bisect_left(self.time_index, key)
+        if idx < len(self.time_index) and self.time_index[idx] == key:
+            del self.time_index[idx]
+        bucket = self.cell_index.get(entry["cell"])
+        if bucket is not None:
+            bucket.discard(entry["seq"])
+            if not bucket:
+                del self.cell_index[entry["cell"]]
+
+    def cells_near(self, lat: float, lon: float, radius: float) -> List[Tuple[int, int]]:
+        dlat = radius / KM_PER_DEGREE
+        lat_min = max(-90.0, lat - dlat)
+        lat_max = min(90.0, lat + dlat)
+        y_min = self.cell_of(lat_min, 0)[1]
+        y_max = self.cell_of(lat_max, 0)[1]
+
+        # Longitude degrees shrink towards the poles; take the widest
+        # latitude in the box so the cells always cover the circle.
+        widest = max(abs(lat_min), abs(lat_max))
+        cos_lat = math.cos(math.radians(widest))
+        if cos_lat <= 1e-9 or radius / (KM_PER_DEGREE * cos_lat) >= 180:
+            xs = range(self.cells_x)
+        else:
+            dlon = radius / (KM_PER_DEGREE * cos_lat)
+            x_min = math.floor((lon - dlon + 180) / self.cell)
+            x_max = math.floor((lon + dlon + 180) / self.cell)
+            if x_max - x_min + 1 >= self.cells_x:
+                xs = range(self.cells_x)
+            else:
+                xs = sorted({x % self.cells_x for x in range(x_min, x_max + 1)})
+
+        return [(x, y) for y in range(y_min, y_max + 1) for x in xs]
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        radius: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        lo = 0
+        hi = len(self.time_index)
+        if start is not None:
+            lo = bisect.bisect_left(self.time_index, (start, -1))
+        if end is not None:
+            hi = bisect.bisect_right(self.time_index, (end, math.inf))
+
+        results = []
+        if radius is None:
+            for _, seq in reversed(self.time_index[lo:hi]):
+                results.append(self.format(self.slots[seq % self.size]))
+                if limit is not None and len(results) >= limit:
+                    break
+            return results
+
+        cells = self.cells_near(lat, lon, radius)
+        if len(cells) > len(self.cell_index):
+            wanted = set(cells)
+            buckets = [b for c, b in self.cell_index.items() if c in wanted]
+        else:
+            buckets = [self.cell_index[c] for c in cells if c in self.cell_index]
+
+        matched = []
+        for bucket in buckets:
+            for seq in bucket:
+                entry = self.slots[seq % self.size]
+                ts = entry["timestamp"]
+                if start is not None and ts < start:
+                    continue
+                if end is not None and ts > end:
+                    continue
+                dist = haversine(lat, lon, entry["lat"], entry["lon"])
+                if dist <= radius:
+                    matched.append((ts, seq, dist))
+
+        matched.sort(reverse=True)
+        if limit is not None:
+            matched = matched[:limit]
+        for _, seq, dist in matched:
+            item = self.format(self.slots[seq % self.size])
+            item["distance"] = dist
+            results.append(item)
+        return results
+
+    def format(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        item = dict(entry["report"])
+        item["seq"] = entry["seq"]
+        item["timestamp"] = entry["timestamp"]
+        item["received"] = entry["received"]
+        return item
+
+
+def user_location(user_name: str) -> Tuple[float, float]:
+    user = config.users.get(user_name)
+    if user is None:
+        raise KeyError(user_name)
+    return config.users.location(user)
+
+
+def json_error(message: str, status: int = 400) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+async def handle_events(request: web.Request) -> web.Response:
+    if event_history is None:
+        return json_error("history is not enabled", status=503)
+
+    q = request.query
+    try:
+        start = parse_time(q["start"]) if "start" in q else None
+        end = parse_time(q["end"]) if "end" in q else None
+        if "since" in q:
+            start = time.time() - float(q["since"])
+        if any(t is not None and not math.isfinite(t) for t in (start, end)):
+            return json_error("start/end/since must be finite")
+        limit = int(q["limit"]) if "limit" in q else None
+        if limit is not None and limit < 1:
+            return json_error("limit must be a positive integer")
+
+        lat = lon = radius = None
+        if "user" in q:
+            lat, lon = user_location(q["user"])
+        if "lat" in q or "lon" in q:
+            lat, lon = float(q["lat"]), float(q["lon"])
+            if not (math.isfinite(lat) and math.isfinite(lon)):
+                return json_error("lat/lon must be finite numbers")
+            if abs(lat) > 90 or abs(lon) > 180:
+                return json_error("lat must be within ±90 and lon within ±180")
+        if "radius" in q:
+            radius = float(q["radius"])
+            if not math.isfinite(radius) or radius <= 0:
+                return json_error("radius must be a positive number")
+            if lat is None:
+                return json_error("radius requires lat/lon or user")
+    except KeyError as e:
+        return json_error(f"unknown or missing parameter: {e}")
+    except ValueError as e:
+        return json_error(f"invalid parameter: {e}")
+
+    t0 = time.perf_counter()
+    events = event_history.query(start, end, lat, lon, radius, limit)
+    elapsed = time.perf_counter() - t0
+    return web.json_response(
+        {"count": len(events), "elapsed_ms": elapsed * 1000, "events": events}
+    )
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    if event_history is None:
+        return json_error("history is not enabled", status=503)
+    return web.json_response(
+        {
+            "size": event_history.size,
+            "stored": len(event_history),
+            "total": event_history.seq,
+            "cells": len(event_history.cell_index),
+        }
+    )
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/events", handle_events)
+    app.router.add_get("/stats", handle_stats)
+    monitor.add_routes(app)
+    return app
+
+
+async def serve_api():
+    global api_runner
+    config_api = config.config.get("api")
+    if config_api is None:
+        return
+    host = config_api.get("host", "127.0.0.1")
+    port = config_api.get("port", 8080)
+
+    api_runner = web.AppRunner(create_app())
+    await api_runner.setup()
+    site = web.TCPSite(api_runner, host, port)
+    await site.start()
+    logger.info(f"History API listening on http://{host}:{port}")
+
+
+event_history = None
+api_runner = None
+
+
+def init_history():
+    global event_history
+    config_history = config.config.get("history")
+    if config_history is None:
+        return None
+
+    event_history = EventHistory(
+        size=config_history.get("size", 10000),
+        cell=config_history.get("cell", 1.0),
+    )
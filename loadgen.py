@@ -0,0 +1,503 @@
+import argparse
+import asyncio
+import base64
+import logging
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+import config
+import history
+import notify
+from handle import handle_report
+from users import UserRegistry
+
+KM_PER_DEGREE = 111.2
+
+logger = logging.getLogger("eqqr.loadgen")
+
+
+class Cluster:
+    def __init__(self, name: str, latitude: float, longitude: float, spread: float):
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.spread = spread
+
+    def sample(self, rng: random.Random, spread: Optional[float] = None) -> Tuple[float, float]:
+        if spread is None:
+            spread = self.spread
+        dlat = rng.gauss(0, spread) / KM_PER_DEGREE
+        cos_lat = max(0.01, math.cos(math.radians(self.latitude)))
+        dlon = rng.gauss(0, spread) / (KM_PER_DEGREE * cos_lat)
+        lat = max(-89.9, min(89.9, self.latitude + dlat))
+        lon = (self.longitude + dlon + 180) % 360 - 180
+        return lat, lon
+
+
+DEFAULT_CLUSTERS = [
+    Cluster("四川", 30.6, 103.0, 150),
+    Cluster("云南", 25.0, 101.5, 150),
+    Cluster("新疆", 41.5, 82.0, 250),
+    Cluster("台湾", 23.8, 121.2, 80),
+]
+
+
+def parse_clusters(value: str) -> List[Cluster]:
+    # "lat,lon,spread_km;lat,lon,spread_km"
+    clusters = []
+    for i, item in enumerate(value.split(";")):
+        lat, lon, spread = (float(x) for x in item.split(","))
+        clusters.append(Cluster(f"cluster{i}", lat, lon, spread))
+    return clusters
+
+
+def parse_rates(value: str) -> List[float]:
+    return [float(r) for r in value.split(",")]
+
+
+def gutenberg_richter(rng: random.Random, m_min: float, m_max: float, b: float) -> float:
+    beta = b * math.log(10)
+    while True:
+        m = m_min + rng.expovariate(beta)
+        if m <= m_max:
+            return m
+
+
+def synthetic_users(
+    rng: random.Random, clusters: List[Cluster], count: int, channels: List[str]
+) -> Dict[str, Any]:
+    users = {}
+    for i in range(count):
+        cluster = rng.choice(clusters)
+        lat, lon = cluster.sample(rng, cluster.spread * 2)
+        contact = {}
+        for channel in channels:
+            if channel == "mail":
+                contact["mail"] = [f"user{i}@loadgen.invalid"]
+            elif channel == "pushdeer":
+                contact["pushdeer"] = [f"PDU{i}"]
+            elif channel == "tg":
+                contact["tg"] = [str(100000 + i)]
+            elif channel == "webhook":
+                contact["webhook"] = [f"loadgen:user{i}"]
+        users[f"user{i}"] = {
+            "location": {"latitude": lat, "longitude": lon},
+            "contact": contact,
+        }
+    return users
+
+
+def synthetic_report(
+    lat: float, lon: float, magnitude: float, location: str, etype: str = "地震预警"
+) -> Dict[str, Any]:
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "source": "loadgen",
+        "type": etype,
+        "location": location,
+        "magnitude": str(round(magnitude, 1)),
+        "depth": "10",
+        "latitude": str(round(lat, 2)),
+        "longitude": str(round(lon, 2)),
+        "intensity": "",
+    }
+
+
+# Yields (offset_seconds, report) for a Poisson stream of mainshocks; each
+# large enough mainshock is followed by a burst of smaller aftershocks.
+def quake_stream(
+    rng: random.Random,
+    clusters: List[Cluster],
+    rate: float,
+    duration: float,
+    m_min: float,
+    m_max: float,
+    b_value: float,
+    aftershock_min: float,
+    aftershock_window: float,
+) -> List[Tuple[float, Dict[str, Any]]]:
+    events = []
+    t = rng.expovariate(rate)
+    while t < duration:
+        cluster = rng.choice(clusters)
+        lat, lon = cluster.sample(rng)
+        magnitude = gutenberg_richter(rng, m_min, m_max, b_value)
+        events.append((t, synthetic_report(lat, lon, magnitude, cluster.name)))
+
+        if magnitude >= aftershock_min:
+            # Båth's law: the largest aftershock is ~1.2 below the mainshock,
+            # and the count grows tenfold per magnitude unit.
+            count = min(200, int(10 ** (magnitude - aftershock_min)))
+            for _ in range(count):
+                delay = aftershock_window * rng.random() ** 3
+                if t + delay >= duration:
+                    continue
+                a_lat, a_lon = Cluster(cluster.name, lat, lon, 10).sample(rng)
+                a_mag = max(m_min, magnitude - 1.2 - rng.expovariate(b_value * math.log(10)))
+                events.append(
+                    (t + delay, synthetic_report(a_lat, a_lon, a_mag, cluster.name + "余震"))
+                )
+        t += rng.expovariate(rate)
+
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+# Local HTTP and SMTP sinks. They run on their own thread and event loop
+# because PushDeerNotifier and TgNotifier block the caller's loop.
+class StandInServers:
+    def __init__(self, http_delay: float = 0.0, smtp_delay: float = 0.0):
+        self.http_delay = http_delay
+        self.smtp_delay = smtp_delay
+        self.http_port = 0
+        self.smtp_port = 0
+        self.http_requests: Dict[str, int] = {}
+        self.smtp_messages = 0
+        self.smtp_recipients = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.http_runner: Optional[web.AppRunner] = None
+        self.smtp_server: Optional[asyncio.AbstractServer] = None
+        self.smtp_writers: Set[asyncio.StreamWriter] = set()
+        self.smtp_tasks: Set[asyncio.Task] = set()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="loadgen-standin", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.setup())
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def setup(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle_http)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self.http_port = runner.addresses[0][1]
+        self.http_runner = runner
+
+        self.smtp_server = await asyncio.start_server(self.handle_smtp, "127.0.0.1", 0)
+        self.smtp_port = self.smtp_server.sockets[0].getsockname()[1]
+
+    async def shutdown(self):
+        self.smtp_server.close()
+        await self.http_runner.cleanup()
+        # Closing the client sockets ends each handler's readline loop, so
+        # the handlers return on their own instead of being cancelled.
+        for writer in list(self.smtp_writers):
+            writer.close()
+        if self.smtp_tasks:
+            await asyncio.wait(self.smtp_tasks, timeout=1)
+
+    async def handle_http(self, request: web.Request) -> web.Response:
+        await request.read()
+        if self.http_delay > 0:
+            await asyncio.sleep(self.http_delay)
+        key = request.path.strip("/").split("/")[0] or "/"
+        self.http_requests[key] = self.http_requests.get(key, 0) + 1
+        return web.json_response({"code": 0})
+
+    async def handle_smtp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        task = asyncio.current_task()
+        self.smtp_tasks.add(task)
+        self.smtp_writers.add(writer)
+        try:
+            await reply("220 loadgen ESMTP")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb in ("EHLO", "HELO"):
+                    await reply("250-loadgen")
+                    await reply("250 AUTH PLAIN LOGIN")
+                elif verb == "AUTH":
+                    parts = command.split()
+                    mechanism = parts[1].upper() if len(parts) > 1 else ""
+                    if mechanism == "PLAIN" and len(parts) < 3:
+                        await reply("334 ")
+                        await reader.readline()
+                    elif mechanism == "LOGIN":
+                        await reply("334 " + base64.b64encode(b"Username:").decode())
+                        await reader.readline()
+                        await reply("334 " + base64.b64encode(b"Password:").decode())
+                        await reader.readline()
+                    await reply("235 Authentication successful")
+                elif verb == "RCPT":
+                    self.smtp_recipients += 1
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    while True:
+                        data = await reader.readline()
+                        if not data or data in (b".\r\n", b".\n"):
+                            break
+                    if self.smtp_delay > 0:
+                        await asyncio.sleep(self.smtp_delay)
+                    self.smtp_messages += 1
+                    await reply("250 OK queued")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("250 OK")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self.smtp_writers.discard(writer)
+            self.smtp_tasks.discard(task)
+
+    def delivered(self) -> int:
+        return sum(self.http_requests.values()) + self.smtp_messages
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+async def run_step(
+    events: List[Tuple[float, Dict[str, Any]]], duration: float, drain: float
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    failures = 0
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def fire(offset: float, report: Dict[str, Any]):
+        nonlocal failures
+        report["time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        try:
+            await handle_report(report)
+        except Exception as e:
+            failures += 1
+            logger.debug(f"handle_report failed: {e}")
+        latencies.append(loop.time() - (start + offset))
+
+    tasks = []
+    for offset, report in events:
+        delay = start + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(offset, report)))
+
+    remaining = max(0.0, start + duration - loop.time())
+    pending = set()
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=remaining + drain)
+    for task in pending:
+        task.cancel()
+    elapsed = loop.time() - start
+
+    return {
+        "events": len(events),
+        "completed": len(latencies),
+        "pending": len(pending),
+        "failures": failures,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else 0.0,
+    }
+
+
+def setup_standin_config(args, servers: StandInServers, rng: random.Random, clusters: List[Cluster]):
+    channels = [c for c in args.channels.split(",") if c]
+    config.config = {
+        "debug": False,
+        "test": False,
+        "users": synthetic_users(rng, clusters, args.users, channels),
+        "notify": {
+            "smtp": {
+                "host": "127.0.0.1",
+                "port": servers.smtp_port,
+                "username": "loadgen@loadgen.invalid",
+                "password": "loadgen",
+                "tls": False,
+            },
+            "pushdeer": {"server": f"http://127.0.0.1:{servers.http_port}"},
+            "tg": {
+                "server": f"http://127.0.0.1:{servers.http_port}/tg",
+                "secret": "loadgen",
+            },
+            "webhook": {
+                # The stand-in only speaks cleartext HTTP/1.1.
+                "http2": False,
+                "secret": "loadgen",
+                "endpoints": {
+                    "loadgen": {
+                        "url": f"http://127.0.0.1:{servers.http_port}/webhook",
+                        "batch": True,
+                    },
+                },
+            },
+        },
+    }
+    if args.history:
+        config.config["history"] = {"size": args.history}
+    config.users = UserRegistry.from_config(config.config["users"])
+    notify.init_notify()
+    history.init_history()
+
+
+async def run_load(args):
+    rng = random.Random(args.seed)
+    clusters = parse_clusters(args.clusters) if args.clusters else DEFAULT_CLUSTERS
+
+    servers = StandInServers(http_delay=args.http_delay, smtp_delay=args.smtp_delay)
+    servers.start()
+    logger.info(
+        f"Stand-in HTTP on 127.0.0.1:{servers.http_port}, SMTP on 127.0.0.1:{servers.smtp_port}"
+    )
+
+    t0 = time.perf_counter()
+    setup_standin_config(args, servers, rng, clusters)
+    logger.info(f"Generated {len(config.users)} users in {time.perf_counter() - t0:.2f}s")
+
+    print(
+        f"{'rate/s':>8} {'events':>7} {'done':>6} {'ev/s':>8} {'notif/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    sustained = 0.0
+    breakdown = None
+    for rate in parse_rates(args.rates):
+        events = quake_stream(
+            rng,
+            clusters,
+            rate,
+            args.duration,
+            args.min_magnitude,
+            args.max_magnitude,
+            args.b_value,
+            args.aftershock_min,
+            args.aftershock_window,
+        )
+        delivered = servers.delivered()
+        result = await run_step(events, args.duration, args.drain)
+        notif_rate = (servers.delivered() - delivered) / result["elapsed"]
+        print(
+            f"{rate:>8.1f} {result['events']:>7} {result['completed']:>6} "
+            f"{result['throughput']:>8.1f} {notif_rate:>8.1f} "
+            f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} "
+            f"{result['p99'] * 1000:>8.1f} {result['max'] * 1000:>8.1f}"
+        )
+
+        offered = result["events"] / args.duration
+        degraded = (
+            result["p95"] > args.latency_budget
+            or result["pending"] > 0
+            or result["throughput"] < 0.9 * offered
+        )
+        if degraded:
+            if breakdown is None:
+                breakdown = rate
+            if not args.keep_going:
+                break
+        elif result["throughput"] > sustained:
+            sustained = result["throughput"]
+
+    if notify.webhook_notifier is not None:
+        await notify.webhook_notifier.client.aclose()
+    servers.stop()
+    print(f"Sustained throughput: {sustained:.1f} events/s with p95 <= {args.latency_budget * 1000:.0f} ms")
+    if breakdown is None:
+        print("Latency did not break down in the tested range")
+    else:
+        print(f"Latency breaks down at an offered rate of {breakdown:.1f} events/s")
+
+
+async def run_inject(args):
+    config.get_config(args.config)
+    config.config["test"] = False
+    notify.init_notify()
+    history.init_history()
+
+    report = synthetic_report(args.latitude, args.longitude, args.magnitude, args.location, args.type)
+    logger.info(f"Injecting {report}")
+    t0 = time.perf_counter()
+    await handle_report(report)
+    logger.info(f"Handled in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="EQQR synthetic load generator")
+    parser.add_argument("--debug", action="store_true", help="log at debug level")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    load = sub.add_parser("load", help="ramp synthetic quakes through stand-in servers")
+    load.add_argument("--users", type=int, default=1000)
+    load.add_argument("--channels", default="pushdeer,tg,mail,webhook", help="contact channels per user")
+    load.add_argument("--rates", default="1,2,5,10,20,50,100", help="offered events/s per step")
+    load.add_argument("--duration", type=float, default=10, help="seconds per step")
+    load.add_argument("--drain", type=float, default=10, help="seconds to wait for stragglers")
+    load.add_argument("--clusters", help='"lat,lon,spread_km;..." (default: China seismic zones)')
+    load.add_argument("--min-magnitude", type=float, default=3.0)
+    load.add_argument("--max-magnitude", type=float, default=8.0)
+    load.add_argument("--b-value", type=float, default=1.0, help="Gutenberg-Richter b-value")
+    load.add_argument("--aftershock-min", type=float, default=5.0, help="mainshock magnitude that triggers a burst")
+    load.add_argument("--aftershock-window", type=float, default=5.0, help="seconds an aftershock burst spans")
+    load.add_argument("--latency-budget", type=float, default=1.0, help="p95 seconds considered healthy")
+    load.add_argument("--http-delay", type=float, default=0.0, help="stand-in HTTP response delay")
+    load.add_argument("--smtp-delay", type=float, default=0.0, help="stand-in SMTP DATA delay")
+    load.add_argument("--history", type=int, default=0, help="enable event history with this size")
+    load.add_argument("--keep-going", action="store_true", help="continue ramping after breakdown")
+    load.add_argument("--seed", type=int, default=None)
+
+    inject = sub.add_parser("inject", help="inject one event into the pipeline of a real config")
+    inject.add_argument("--config", default="config.yaml")
+    inject.add_argument("--latitude", type=float, required=True)
+    inject.add_argument("--longitude", type=float, required=True)
+    inject.add_argument("--magnitude", type=float, required=True)
+    inject.add_argument("--location", default="测试地点")
+    inject.add_argument("--type", default="地震预警")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.WARNING,
+        format="%(asctime)s [%(name)s] %(levelname)s: %(message)s",
+    )
+    # The pipeline logs every notification at INFO; keep that quiet under
+    # load but still show the generator's own progress.
+    if not args.debug:
+        logger.setLevel(logging.INFO)
+    logging.getLogger("httpx").disabled = True
+    logging.getLogger("httpcore").disabled = True
+
+    loop = asyncio.new_event_loop()
+    if args.command == "load":
+        loop.run_until_complete(run_load(args))
+    else:
+        loop.run_until_complete(run_inject(args))
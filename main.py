@@ -5,6 +5,9 @@ import sys
 from config import get_config
 from handle import serve
 from notify import init_notify
+from history import init_history
+from coord import init_coord
+from monitor import init_monitor
 
 
 def setup_logging(debug=False):
@@ -35,5 +38,8 @@ if __name__ == "__main__":
     config = get_config(config_file)
     setup_logging(debug=config["debug"])
     init_notify()
+    init_history()
+    init_coord()
+    init_monitor()
     loop = asyncio.new_event_loop()
     loop.run_until_complete(main())
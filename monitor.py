@@ -0,0 +1,253 @@
+import asyncio
+import collections
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from aiohttp import web
+
+import config
+
+logger = logging.getLogger("eqqr.monitor")
+
+
+def task_name(loop: asyncio.AbstractEventLoop) -> str:
+    # Read from another thread; the loop only swaps this entry between steps.
+    task = asyncio.current_task(loop)
+    if task is None:
+        return "<no task>"
+    coro = task.get_coro()
+    return f"{task.get_name()} {getattr(coro, '__qualname__', coro)}"
+
+
+def collapse_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+# A heartbeat coroutine records when the loop last ran; a watchdog thread
+# notices when it goes stale and captures the loop thread's stack while the
+# blocking call is still on it.
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+        self.last_beat = time.monotonic()
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.reported = False
+        self.stopped = threading.Event()
+
+    async def heartbeat(self):
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        threading.Thread(target=self.watch, name="eqqr-watchdog", daemon=True).start()
+
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.last_beat = now
+            if self.lag > self.threshold:
+                self.stalls += 1
+                logger.warning(f"Event loop lagged {self.lag * 1000:.0f} ms")
+            self.reported = False
+
+    def watch(self):
+        while not self.stopped.wait(self.threshold / 2):
+            stalled = time.monotonic() - self.last_beat - self.interval
+            if stalled <= self.threshold or self.reported:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.reported = True
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(
+                f"Event loop blocked for {stalled * 1000:.0f} ms in "
+                f"{task_name(self.loop)}:\n{stack}"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lag_ms": self.lag * 1000,
+            "max_lag_ms": self.max_lag * 1000,
+            "stalls": self.stalls,
+            "threshold_ms": self.threshold * 1000,
+        }
+
+
+# Samples the loop thread's stack on a timer while enabled. Samples are kept
+# back to one window before the oldest event not yet dumped, so slow events
+# keep their whole profile; after each event, the samples around it are
+# written as collapsed stacks that flamegraph.pl and speedscope read directly.
+class SamplingProfiler:
+    def __init__(
+        self,
+        interval: float = 0.005,
+        window: float = 2.0,
+        directory: str = "profiles",
+        enabled: bool = False,
+    ):
+        self.interval = interval
+        self.window = window
+        self.directory = directory
+        self.enabled = threading.Event()
+        if enabled:
+            self.enabled.set()
+        self.samples: Deque[Tuple[float, str]] = collections.deque()
+        self.pending: Dict[int, float] = {}
+        self.next_token = 0
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self.thread = threading.Thread(target=self.run, name="eqqr-profiler", daemon=True)
+        self.thread.start()
+
+    def toggle(self, enable: Optional[bool] = None) -> bool:
+        if enable is None:
+            enable = not self.enabled.is_set()
+        if enable:
+            self.enabled.set()
+        else:
+            self.enabled.clear()
+            with self.lock:
+                self.samples.clear()
+                self.pending.clear()
+        logger.warning(f"Sampling profiler {'enabled' if enable else 'disabled'}")
+        return enable
+
+    def run(self):
+        while True:
+            self.enabled.wait()
+            now = time.time()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = f"{task_name(self.loop)};{collapse_stack(frame)}"
+                with self.lock:
+                    self.samples.append((now, stack))
+                    cutoff = now - self.window
+                    if self.pending:
+                        cutoff = min(cutoff, min(self.pending.values()))
+                    while self.samples and self.samples[0][0] < cutoff:
+                        self.samples.popleft()
+            del frame
+            time.sleep(self.interval)
+
+    def begin_event(self) -> Optional[int]:
+        if not self.enabled.is_set():
+            return None
+        with self.lock:
+            token = self.next_token
+            self.next_token += 1
+            self.pending[token] = time.time() - self.window
+        return token
+
+    def mark_event(self, token: Optional[int], report: Dict[str, Any]):
+        if token is None:
+            return
+        finished = time.time()
+        label = f"{report.get('source', '')}-{report.get('time', '')}"
+        self.loop.call_later(self.window, self.dump, token, finished + self.window, label)
+
+    def dump(self, token: int, end: float, label: str):
+        with self.lock:
+            start = self.pending.pop(token, None)
+            if start is None:
+                return
+            stacks = [s for t, s in self.samples if start <= t <= end]
+        if not stacks:
+            return
+        counts = collections.Counter(stacks)
+        name = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+        path = os.path.join(self.directory, f"{int(start)}-{name}.folded")
+        self.loop.run_in_executor(None, self.write, path, counts)
+
+    def write(self, path: str, counts: collections.Counter):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"Wrote profile {path} ({sum(counts.values())} samples)")
+        except Exception as e:
+            logger.error(f"Failed to write profile {path}: {e}")
+
+
+async def handle_loop(request: web.Request) -> web.Response:
+    if loop_monitor is None:
+        return web.json_response({"error": "monitor is not enabled"}, status=503)
+    return web.json_response(loop_monitor.stats())
+
+
+async def handle_profile(request: web.Request) -> web.Response:
+    if profiler is None:
+        return web.json_response({"error": "monitor is not enabled"}, status=503)
+    if request.method == "POST":
+        enable = request.query.get("enable")
+        profiler.toggle(None if enable is None else enable in ("1", "true", "on"))
+    return web.json_response(
+        {"enabled": profiler.enabled.is_set(), "samples": len(profiler.samples)}
+    )
+
+
+def add_routes(app: web.Application):
+    app.router.add_get("/debug/loop", handle_loop)
+    app.router.add_get("/debug/profile", handle_profile)
+    app.router.add_post("/debug/profile", handle_profile)
+
+
+async def serve_monitor():
+    if loop_monitor is None:
+        return
+    loop = asyncio.get_running_loop()
+    profiler.start(loop)
+    try:
+        loop.add_signal_handler(signal.SIGUSR2, profiler.toggle)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        logger.debug("SIGUSR2 is not available, use the API to toggle profiling")
+    await loop_monitor.heartbeat()
+
+
+loop_monitor = None
+profiler = None
+
+
+def init_monitor():
+    global loop_monitor, profiler
+    config_monitor = config.config.get("monitor")
+    if config_monitor is None:
+        return None
+
+    loop_monitor = LoopMonitor(
+        interval=config_monitor.get("lag_interval", 0.1),
+        threshold=config_monitor.get("lag_threshold", 0.1),
+    )
+    profiler = SamplingProfiler(
+        interval=config_monitor.get("profile_interval", 0.005),
+        window=config_monitor.get("profile_window", 2.0),
+        directory=config_monitor.get("profile_dir", "profiles"),
+        enabled=config_monitor.get("profile", False),
+    )
@@ -1,6 +1,10 @@
+import asyncio
+import hashlib
+import hmac
 import json
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
 from email.header import Header
 from email.mime.text import MIMEText
 from aiosmtplib import SMTP
@@ -60,6 +64,8 @@ class MailNotifier(Notifier):
         else:
             mail_title = subject
 
+        mail_tls = False
+        start_tls = False
         if self.mail_port == 465 or self.mail_tls:
             mail_tls = True
             start_tls = False
@@ -194,14 +200,132 @@ class AliSMSNotifier(Notifier):
                 )
 
 
+class WebhookNotifier(Notifier):
+    def __init__(
+        self,
+        endpoints: Optional[Dict[str, Dict[str, Any]]] = None,
+        secret: str = "",
+        http2: bool = True,
+        timeout: float = 5,
+        max_connections: int = 100,
+        batch_size: int = 50,
+    ):
+        super().__init__(name="webhook")
+        self.endpoints = endpoints or {}
+        self.secret = secret
+        self.batch_size = batch_size
+        # One pooled client for all endpoints: HTTP/2 multiplexes every
+        # concurrent post to the same host over a single connection.
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self.logger = logging.getLogger("eqqr.notifier.webhook")
+
+    def resolve(self, target: str):
+        if target.startswith("http://") or target.startswith("https://"):
+            return target, {"url": target}, ""
+        name, _, recipient = target.partition(":")
+        endpoint = self.endpoints.get(name)
+        if endpoint is None or not endpoint.get("url"):
+            return None, None, ""
+        return name, endpoint, recipient
+
+    def sign(self, secret: str, body: bytes) -> Dict[str, str]:
+        timestamp = str(int(time.time()))
+        digest = hmac.new(
+            secret.encode("utf-8"), timestamp.encode() + b"." + body, hashlib.sha256
+        ).hexdigest()
+        return {"X-Eqqr-Timestamp": timestamp, "X-Eqqr-Signature": f"sha256={digest}"}
+
+    async def post(self, endpoint: Dict[str, Any], payload: Dict[str, Any]):
+        url = endpoint["url"]
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+        headers = {"Content-Type": "application/json"}
+        headers.update(endpoint.get("headers") or {})
+        secret = endpoint.get("secret") or self.secret
+        if secret:
+            headers.update(self.sign(secret, body))
+
+        try:
+            response = await self.client.post(url, content=body, headers=headers)
+        except Exception as e:
+            self.logger.error(f"Failed to send webhook to {url}: {e}")
+            return
+        if response.status_code // 100 != 2:
+            self.logger.error(
+                f"Failed to send webhook to {url}: {response.status_code} {response.text}"
+            )
+        else:
+            self.logger.info(f"Sent webhook to {url} successful ({response.http_version})")
+
+    def messages(
+        self,
+        content: str,
+        to: str | List[str],
+        subject: Optional[str] = None,
+        report: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+        if isinstance(to, str):
+            to = [to]
+
+        messages = []
+        seen = set()
+        for target in to:
+            key, endpoint, recipient = self.resolve(target)
+            if key is None:
+                self.logger.error(f"Unknown webhook endpoint: {target}")
+                continue
+            if (key, recipient) in seen:
+                continue
+            seen.add((key, recipient))
+            message = {"subject": subject, "msg": content, "report": report}
+            if recipient:
+                message["recipient"] = recipient
+            messages.append((key, endpoint, message))
+        return messages
+
+    async def send(self, messages: List[Tuple[str, Dict[str, Any], Dict[str, Any]]]):
+        groups: Dict[str, Any] = {}
+        for key, endpoint, message in messages:
+            groups.setdefault(key, (endpoint, []))[1].append(message)
+
+        posts = []
+        for endpoint, group in groups.values():
+            if endpoint.get("batch", False):
+                size = endpoint.get("batch_size", self.batch_size)
+                for i in range(0, len(group), size):
+                    posts.append(self.post(endpoint, {"messages": group[i : i + size]}))
+            else:
+                for message in group:
+                    posts.append(self.post(endpoint, message))
+        await asyncio.gather(*posts)
+
+    async def emit(
+        self,
+        content: str,
+        to: str | List[str],
+        subject: Optional[str] = None,
+        report: Optional[Dict[str, Any]] = None,
+    ):
+        await self.send(self.messages(content, to, subject, report))
+
+
 mail_notifier = None
 pushdeer_notifier = None
 tg_notifier = None
 alisms_notifier = None
+webhook_notifier = None
 
 
 def init_notify():
-    global mail_notifier, pushdeer_notifier, tg_notifier, alisms_notifier
+    global mail_notifier, pushdeer_notifier, tg_notifier, alisms_notifier, webhook_notifier
     config_notify = config.config.get("notify")
     if config_notify is None:
         return None
@@ -244,6 +368,17 @@ def init_notify():
                 sign_name=sign_name,
             )
 
+    config_webhook = config_notify.get("webhook")
+    if config_webhook is not None:
+        webhook_notifier = WebhookNotifier(
+            endpoints=config_webhook.get("endpoints", {}),
+            secret=config_webhook.get("secret", ""),
+            http2=config_webhook.get("http2", True),
+            timeout=config_webhook.get("timeout", 5),
+            max_connections=config_webhook.get("max_connections", 100),
+            batch_size=config_webhook.get("batch_size", 50),
+        )
+
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,108 @@
+import math
+import sys
+from array import array
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+
+class User(NamedTuple):
+    name: str
+    index: int
+    contact: Mapping[str, Tuple[str, ...]]
+
+
+def parse_coordinate(value: Any, name: str, limit: float) -> float:
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    try:
+        coord = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, got {value!r}") from None
+    if not math.isfinite(coord) or abs(coord) > limit:
+        raise ValueError(f"{name} must be within ±{limit:g}, got {value!r}")
+    return coord
+
+
+def parse_contact(contact: Optional[Dict[str, Any]]) -> Mapping[str, Tuple[str, ...]]:
+    if contact is None:
+        return MappingProxyType({})
+    if not isinstance(contact, dict):
+        raise ValueError(f"contact must be a mapping, got {type(contact).__name__}")
+
+    channels = {}
+    for channel, targets in contact.items():
+        if targets is None:
+            continue
+        if isinstance(targets, (str, int)) and not isinstance(targets, bool):
+            targets = [targets]
+        if not isinstance(targets, list):
+            raise ValueError(f"contact.{channel} must be a list")
+        for t in targets:
+            if not isinstance(t, (str, int)) or isinstance(t, bool):
+                raise ValueError(f"contact.{channel} has an invalid target {t!r}")
+        values = tuple(sys.intern(str(t)) for t in targets if str(t) != "")
+        if values:
+            channels[sys.intern(str(channel))] = values
+    return MappingProxyType(channels)
+
+
+# Users are validated once at load: coordinates are packed into float64
+# arrays so the per-event loop reads plain floats, and contacts are frozen
+# into interned tuples per channel.
+class UserRegistry:
+    __slots__ = ("users", "latitudes", "longitudes", "by_name")
+
+    def __init__(
+        self, users: List[User], latitudes: array, longitudes: array
+    ):
+        self.users: Tuple[User, ...] = tuple(users)
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.by_name: Dict[str, User] = {u.name: u for u in self.users}
+
+    @classmethod
+    def from_config(cls, config_users: Optional[Dict[str, Any]]) -> "UserRegistry":
+        if config_users is None:
+            config_users = {}
+        if not isinstance(config_users, dict):
+            raise ValueError("users must be a mapping of name to user")
+
+        users = []
+        latitudes = array("d")
+        longitudes = array("d")
+        for user_name, user_info in config_users.items():
+            user_name = sys.intern(str(user_name))
+            try:
+                if not isinstance(user_info, dict):
+                    raise ValueError("user must be a mapping")
+                location = user_info.get("location")
+                if not isinstance(location, dict):
+                    raise ValueError("location is missing")
+                lat = parse_coordinate(location.get("latitude"), "latitude", 90)
+                lon = parse_coordinate(location.get("longitude"), "longitude", 180)
+                contact = parse_contact(user_info.get("contact"))
+            except ValueError as e:
+                raise ValueError(f"user {user_name}: {e}") from None
+
+            users.append(User(user_name, len(users), contact))
+            latitudes.append(lat)
+            longitudes.append(lon)
+        return cls(users, latitudes, longitudes)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def __iter__(self) -> Iterator[User]:
+        return iter(self.users)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def get(self, name: str) -> Optional[User]:
+        return self.by_name.get(name)
+
+    def location(self, user: User) -> Tuple[float, float]:
+        return self.latitudes[user.index], self.longitudes[user.index]
+
+    def locations(self) -> Iterator[Tuple[User, float, float]]:
+        return zip(self.users, self.latitudes, self.longitudes)